@@ -0,0 +1,290 @@
+"""
+Base chain access shared by the API servers: a single Web3 provider and
+contract set per process, and batched, cached Morpho position reads
+"""
+
+from fastapi import HTTPException
+from web3 import AsyncWeb3, AsyncHTTPProvider, Web3
+from cachetools import TTLCache
+from eth_utils import function_signature_to_4byte_selector
+import functools
+import logging
+import re
+import time
+import weakref
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
+from morpho_constants import (
+    BASE_RPC_URL,
+    MORPHO_LENS_ADDRESS,
+    MULTICALL3_ADDRESS,
+    MULTICALL3_ABI,
+    MARKETS,
+    MARKETS_B32,
+    MOCK_POSITIONS_NORM
+)
+
+logger = logging.getLogger(__name__)
+
+# Cheap shape check run before the keccak-based checksum
+_ADDR_RE = re.compile(r"0x[0-9a-fA-F]{40}")
+
+# Lens position() calldata pieces, precomputed so requests skip the ABI encoder
+POSITION_SELECTOR = function_signature_to_4byte_selector("position(bytes32,address)")
+POSITION_OUTPUT_TYPES = ["uint256", "uint256", "uint256"]
+
+# Coalescing of concurrent position reads into Multicall3 batches
+BATCH_WINDOW_MS = 5
+MAX_BATCH = 50  # keeps a single eth_call payload well under RPC size limits
+_pending: List[Tuple[asyncio.Future, str, str]] = []
+_flush_task: Optional[asyncio.Task] = None
+
+# Memoized position reads, keyed by (market_id, wallet, block bucket)
+POSITION_CACHE_TTL = 12  # seconds; a Base block is ~2s
+BLOCK_BUCKET_SIZE = 6  # blocks per cache bucket
+BLOCK_NUMBER_MAX_AGE = 1.0  # poll eth_blockNumber at most once per second
+BLOCK_TICK_INTERVAL = 2.0  # block ticker poll interval, matching Base block time
+_position_cache: TTLCache = TTLCache(maxsize=10_000, ttl=POSITION_CACHE_TTL)
+_position_locks: "weakref.WeakValueDictionary[Tuple[str, str], asyncio.Lock]" = weakref.WeakValueDictionary()
+_block_number = {"value": 0, "fetched_at": 0.0}
+_block_ticker_task: Optional[asyncio.Task] = None
+
+# Cleared at startup when the Lens has no bytecode; every read would revert,
+# so requests go straight to mock data instead of paying for the RPC
+HAS_LENS_CODE = True
+
+@functools.lru_cache(maxsize=1)
+def get_w3() -> AsyncWeb3:
+    """Create the process-wide Web3 client; web3 reuses one aiohttp session per RPC URI"""
+    return AsyncWeb3(AsyncHTTPProvider(BASE_RPC_URL, request_kwargs={"timeout": 10}))
+
+@functools.lru_cache(maxsize=1)
+def get_multicall():
+    """Get the Multicall3 contract used to batch Lens reads"""
+    multicall = get_w3().eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+    logger.info(f"Initialized Multicall3 contract at {MULTICALL3_ADDRESS}")
+    return multicall
+
+async def check_lens_code() -> bool:
+    """Check once whether the Morpho Lens has bytecode and record it in HAS_LENS_CODE"""
+    global HAS_LENS_CODE
+    try:
+        HAS_LENS_CODE = len(await get_w3().eth.get_code(MORPHO_LENS_ADDRESS)) > 0
+    except Exception as e:
+        logger.warning(f"Could not check Morpho Lens bytecode, keeping on-chain reads enabled: {str(e)}")
+        return HAS_LENS_CODE
+    if not HAS_LENS_CODE:
+        logger.warning(f"No contract code at Morpho Lens {MORPHO_LENS_ADDRESS}, serving mock positions")
+    return HAS_LENS_CODE
+
+@functools.lru_cache(maxsize=4096)
+def _checksum(address: str) -> str:
+    """Checksum an address, memoized so repeat wallets skip the keccak"""
+    return Web3.to_checksum_address(address)
+
+def _position_result(wallet_address: str, pool_id: str, market_id: str, position) -> Dict[str, Any]:
+    """Format an on-chain position tuple as a tool response"""
+    return {
+        "wallet": wallet_address,
+        "pool_id": pool_id,
+        "market_id": market_id,
+        "position": {
+            "supply": str(position[0]),
+            "borrow": str(position[1]),
+            "collateral": str(position[2])
+        },
+        "source": "chain"
+    }
+
+def _fallback_position(wallet_address: str, pool_id: str, market_id: str) -> Dict[str, Any]:
+    """Build a position response from mock data when the chain read failed"""
+    mock_data = MOCK_POSITIONS_NORM.get(wallet_address.lower(), {}).get(pool_id)
+    if mock_data:
+        logger.info("Using mock data for position")
+        return {
+            "wallet": wallet_address,
+            "pool_id": pool_id,
+            "market_id": market_id,
+            **mock_data,
+            "source": "mock"
+        }
+    # If no mock data, return empty position
+    logger.info("No mock data found, returning empty position")
+    return {
+        "wallet": wallet_address,
+        "pool_id": pool_id,
+        "market_id": market_id,
+        "supply_shares": "0",
+        "borrow_shares": "0",
+        "collateral": "0",
+        "source": "empty"
+    }
+
+def _position_calldata(wallet_address: str, pool_id: str) -> bytes:
+    """Build position(bytes32,address) calldata from the precomputed selector and market id"""
+    return POSITION_SELECTOR + MARKETS_B32[pool_id] + b"\x00" * 12 + bytes.fromhex(wallet_address[2:])
+
+async def multicall_positions(pairs: List[Tuple[str, str]]) -> List[Optional[Tuple[int, int, int]]]:
+    """Read (wallet, pool_id) positions in one Multicall3 round trip; failed sub-calls come back as None"""
+    calls = [(MORPHO_LENS_ADDRESS, _position_calldata(wallet, pool_id)) for wallet, pool_id in pairs]
+    results = await get_multicall().functions.tryAggregate(False, calls).call()
+
+    codec = get_w3().codec
+    positions: List[Optional[Tuple[int, int, int]]] = []
+    for success, return_data in results:
+        if success and return_data:
+            positions.append(tuple(codec.decode(POSITION_OUTPUT_TYPES, return_data)))
+        else:
+            positions.append(None)
+    return positions
+
+async def _read_position(wallet_address: str, pool_id: str) -> Optional[Tuple[int, int, int]]:
+    """Read a single position directly from the Lens, returning None on failure"""
+    w3 = get_w3()
+    try:
+        result = await w3.eth.call({"to": MORPHO_LENS_ADDRESS, "data": _position_calldata(wallet_address, pool_id)})
+        return tuple(w3.codec.decode(POSITION_OUTPUT_TYPES, result))
+    except Exception as e:
+        logger.warning(f"Failed to get on-chain position for {wallet_address} in {pool_id}: {str(e)}")
+        return None
+
+async def _read_positions(pairs: List[Tuple[str, str]]) -> List[Optional[Tuple[int, int, int]]]:
+    """Read positions through Multicall3, falling back to one call per pair if the batch reverts"""
+    try:
+        return await multicall_positions(pairs)
+    except Exception as e:
+        logger.warning(f"Multicall3 batch failed, falling back to per-call reads: {str(e)}")
+        return list(await asyncio.gather(
+            *(_read_position(wallet_address, pool_id) for wallet_address, pool_id in pairs)
+        ))
+
+async def _flush_batch(batch: List[Tuple[asyncio.Future, str, str]]):
+    """Read one Multicall3 batch and resolve its callers' futures"""
+    logger.info(f"Fetching {len(batch)} positions via Multicall3")
+    positions = await _read_positions([(wallet_address, pool_id) for _, wallet_address, pool_id in batch])
+    for (future, _, _), position in zip(batch, positions):
+        if not future.done():
+            future.set_result(position)
+
+async def _flush_pending():
+    """Drain queued position reads into concurrent Multicall3 batches once the batching window closes"""
+    global _flush_task
+    batch: List[Tuple[asyncio.Future, str, str]] = []
+    try:
+        await asyncio.sleep(BATCH_WINDOW_MS / 1000)
+        # Take everything queued so far; reads queued while these RPCs run start a new window
+        batch = _pending[:]
+        _pending.clear()
+        _flush_task = None
+        await asyncio.gather(
+            *(_flush_batch(batch[i:i + MAX_BATCH]) for i in range(0, len(batch), MAX_BATCH))
+        )
+    finally:
+        # A flush cancelled mid-read must not leave its callers waiting forever
+        for future, _, _ in batch:
+            if not future.done():
+                future.cancel()
+
+def _release_pending(task: asyncio.Task):
+    """Cancel queued reads whose flush task ended before draining them"""
+    global _flush_task
+    if _flush_task is task:
+        for future, _, _ in _pending:
+            future.cancel()
+        _pending.clear()
+        _flush_task = None
+
+async def _queue_position_read(wallet_address: str, pool_id: str) -> Optional[Tuple[int, int, int]]:
+    """Queue a position read to be coalesced with other in-flight reads"""
+    global _flush_task
+    future = asyncio.get_running_loop().create_future()
+    _pending.append((future, wallet_address, pool_id))
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_pending())
+        _flush_task.add_done_callback(_release_pending)
+    return await future
+
+async def _block_ticker():
+    """Keep the latest block number in memory, polling every BLOCK_TICK_INTERVAL"""
+    while True:
+        try:
+            _block_number["value"] = await get_w3().eth.block_number
+            _block_number["fetched_at"] = time.monotonic()
+        except Exception as e:
+            logger.warning(f"Block ticker failed to refresh block number: {str(e)}")
+        await asyncio.sleep(BLOCK_TICK_INTERVAL)
+
+def start_block_ticker():
+    """Start the background block ticker if it isn't already running"""
+    global _block_ticker_task
+    if _block_ticker_task is None:
+        _block_ticker_task = asyncio.create_task(_block_ticker())
+
+async def stop_block_ticker():
+    """Stop the background block ticker"""
+    global _block_ticker_task
+    if _block_ticker_task is not None:
+        _block_ticker_task.cancel()
+        await asyncio.gather(_block_ticker_task, return_exceptions=True)
+        _block_ticker_task = None
+
+async def current_block_number() -> int:
+    """Return the latest block number from the ticker, or poll at most once per BLOCK_NUMBER_MAX_AGE"""
+    if _block_ticker_task is not None and _block_number["value"]:
+        return _block_number["value"]
+    now = time.monotonic()
+    if now - _block_number["fetched_at"] >= BLOCK_NUMBER_MAX_AGE:
+        # Claim the refresh before awaiting so concurrent callers reuse the current value
+        _block_number["fetched_at"] = now
+        try:
+            _block_number["value"] = await get_w3().eth.block_number
+        except Exception as e:
+            logger.warning(f"Failed to refresh block number, keeping {_block_number['value']}: {str(e)}")
+    return _block_number["value"]
+
+async def _cached_position_read(wallet_address: str, pool_id: str) -> Optional[Tuple[int, int, int]]:
+    """Read a position through the TTL cache, letting one caller per key hit the chain on a miss"""
+    market_id = MARKETS[pool_id]
+    lock = _position_locks.get((market_id, wallet_address))
+    if lock is None:
+        lock = _position_locks[(market_id, wallet_address)] = asyncio.Lock()
+
+    async with lock:
+        key = (market_id, wallet_address, await current_block_number() // BLOCK_BUCKET_SIZE)
+        position = _position_cache.get(key)
+        if position is None:
+            position = await _queue_position_read(wallet_address, pool_id)
+            if position is not None:
+                _position_cache[key] = position
+        return position
+
+async def get_morpho_position(wallet: str, pool_id: str) -> Dict[str, Any]:
+    """Get Morpho position for a wallet in a specific pool"""
+    try:
+        # Validate addresses
+        if not isinstance(wallet, str) or not _ADDR_RE.fullmatch(wallet):
+            raise ValueError(f"Invalid wallet address: {wallet}")
+        wallet_address = _checksum(wallet)
+        market_id = MARKETS.get(pool_id)
+
+        if not market_id:
+            raise ValueError(f"Invalid pool_id: {pool_id}")
+
+        if not HAS_LENS_CODE:
+            return _fallback_position(wallet_address, pool_id, market_id)
+
+        logger.info(f"Fetching position for wallet {wallet_address} in pool {pool_id} (market ID: {market_id})")
+
+        # Get position from Morpho Lens, cached and batched with any concurrent reads
+        position = await _cached_position_read(wallet_address, pool_id)
+        if position is None:
+            logger.warning("Failed to get on-chain position, falling back to mock data")
+            return _fallback_position(wallet_address, pool_id, market_id)
+        return _position_result(wallet_address, pool_id, market_id, position)
+
+    except ValueError as e:
+        logger.error(f"Error getting Morpho position: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Unexpected error getting Morpho position: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -12,7 +12,9 @@ TEST_EOA = "0x2E2Ea30Ba045Df4bC38e80cF11E119E12e06C1C2"
 
 # Morpho Blue contract addresses on Base
 MORPHO_LENS_ADDRESS = "0x0e8cD5F5e9Fb2b70D1bE8c8A701Fe758e6F7e54A"  # Real Morpho Lens on Base
-MORPHO_FACTORY_ADDRESS = "0xbbbbbBf82BB0AF3171F4109C099b861f766d0fB1"
+
+# Multicall3 is deployed at the same address on every EVM chain, including Base
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
 
 # Morpho Blue markets on Base
 MARKETS = {
@@ -22,9 +24,12 @@ MARKETS = {
     "USDbC/USDC": "0x4b592c6018b08a4fc0a33d0de0b8f2c3a42c5c6d8e314a26f04d312434191836"
 }
 
+# Market IDs as raw bytes32, decoded once so requests don't re-parse the hex
+MARKETS_B32 = {pool_id: bytes.fromhex(market_id.removeprefix("0x")) for pool_id, market_id in MARKETS.items()}
+
 # Convert all addresses to checksum format
 MORPHO_LENS_ADDRESS = Web3.to_checksum_address(MORPHO_LENS_ADDRESS)
-MORPHO_FACTORY_ADDRESS = Web3.to_checksum_address(MORPHO_FACTORY_ADDRESS)
+MULTICALL3_ADDRESS = Web3.to_checksum_address(MULTICALL3_ADDRESS)
 
 # Mock data for testing
 MOCK_POSITIONS = {
@@ -42,91 +47,57 @@ MOCK_POSITIONS = {
     }
 }
 
-# Morpho Blue Lens ABI
-MORPHO_LENS_ABI = [
+# Mock positions keyed by lowercase address so lookups need no checksum
+MOCK_POSITIONS_NORM = {address.lower(): pools for address, pools in MOCK_POSITIONS.items()}
+
+# Multicall3 ABI (tryAggregate only)
+MULTICALL3_ABI = [
     {
         "inputs": [
             {
-                "internalType": "address",
-                "name": "market",
-                "type": "address"
+                "internalType": "bool",
+                "name": "requireSuccess",
+                "type": "bool"
             },
             {
-                "internalType": "address",
-                "name": "user",
-                "type": "address"
+                "components": [
+                    {
+                        "internalType": "address",
+                        "name": "target",
+                        "type": "address"
+                    },
+                    {
+                        "internalType": "bytes",
+                        "name": "callData",
+                        "type": "bytes"
+                    }
+                ],
+                "internalType": "struct Multicall3.Call[]",
+                "name": "calls",
+                "type": "tuple[]"
             }
         ],
-        "name": "position",
+        "name": "tryAggregate",
         "outputs": [
             {
-                "internalType": "uint256",
-                "name": "supplyShares",
-                "type": "uint256"
-            },
-            {
-                "internalType": "uint256",
-                "name": "borrowShares",
-                "type": "uint256"
-            },
-            {
-                "internalType": "uint256",
-                "name": "collateral",
-                "type": "uint256"
+                "components": [
+                    {
+                        "internalType": "bool",
+                        "name": "success",
+                        "type": "bool"
+                    },
+                    {
+                        "internalType": "bytes",
+                        "name": "returnData",
+                        "type": "bytes"
+                    }
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]"
             }
         ],
-        "stateMutability": "view",
+        "stateMutability": "payable",
         "type": "function"
     }
 ]
-
-# Morpho Factory ABI
-MORPHO_FACTORY_ABI = [
-    {
-        "inputs": [
-            {
-                "internalType": "address",
-                "name": "market",
-                "type": "address"
-            }
-        ],
-        "name": "market",
-        "outputs": [
-            {
-                "internalType": "address",
-                "name": "loanToken",
-                "type": "address"
-            },
-            {
-                "internalType": "address",
-                "name": "collateralToken",
-                "type": "address"
-            },
-            {
-                "internalType": "address",
-                "name": "oracle",
-                "type": "address"
-            },
-            {
-                "internalType": "address",
-                "name": "irm",
-                "type": "address"
-            },
-            {
-                "internalType": "uint256",
-                "name": "lltv",
-                "type": "uint256"
-            }
-        ],
-        "stateMutability": "view",
-        "type": "function"
-    }
-]
-
-# Market IDs for Morpho Blue markets on Base
-MARKET_IDS = {
-    "cbBTC/USDC": "0x9103c3b4e834476c9a62ea009ba2c884ee42e94e6e314a26f04d312434191836",
-    "cbETH/USDC": "0x7b592c6018b08a4fc0a33d0de0b8f2c3a42c5c6d8e314a26f04d312434191836",
-    "wstETH/USDC": "0x5b592c6018b08a4fc0a33d0de0b8f2c3a42c5c6d8e314a26f04d312434191836",
-    "USDbC/USDC": "0x4b592c6018b08a4fc0a33d0de0b8f2c3a42c5c6d8e314a26f04d312434191836"
-}
\ No newline at end of file
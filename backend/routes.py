@@ -0,0 +1,123 @@
+"""
+Routes shared by the API servers: the /tools endpoint and the /ws agent interface
+"""
+
+from fastapi import APIRouter, WebSocket, HTTPException
+import logging
+import orjson
+from typing import Dict, Any, List, Optional, Union
+import asyncio
+from chain import get_morpho_position
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Replies queued per WebSocket before a client that isn't reading gets disconnected
+WS_MAX_PENDING = 64
+WS_INVALID_JSON_REPLY = orjson.dumps({"status": "error", "message": "Invalid JSON"}).decode()
+
+# Most tool requests accepted in one /tools batch (two Multicall3 batches of position reads)
+MAX_TOOL_BATCH = 100
+
+async def summarize_text(text: str) -> Dict[str, Any]:
+    """Summarize the given text"""
+    # For now, just echo the text
+    return {"summary": text}
+
+@router.post("/tools")
+async def run_tool(request: Union[Dict[str, Any], List[Dict[str, Any]]]):
+    """Run a specific tool based on the request, or a list of tools in one batch"""
+    if isinstance(request, list):
+        if len(request) > MAX_TOOL_BATCH:
+            raise HTTPException(status_code=400, detail=f"Batch exceeds {MAX_TOOL_BATCH} tool requests")
+        return await run_tools_batch(request)
+    try:
+        task = request.get("task")
+        if not task:
+            raise HTTPException(status_code=400, detail="No task specified")
+
+        if task == "summarize":
+            text = request.get("text", "")
+            return await summarize_text(text)
+        elif task == "morpho_get_position":
+            wallet = request.get("wallet")
+            pool_id = request.get("pool_id")
+            if not wallet or not pool_id:
+                raise HTTPException(status_code=400, detail="Missing wallet or pool_id")
+            return await get_morpho_position(wallet, pool_id)
+        else:
+            raise HTTPException(status_code=400, detail=f"Unknown task: {task}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error running tool: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def run_tools_batch(tool_requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Run a list of tool requests concurrently so position reads share one multicall.
+
+    A failing entry yields its own {"status_code", "detail"} item instead of failing the batch.
+    """
+    results = await asyncio.gather(
+        *(run_tool(tool_request) for tool_request in tool_requests),
+        return_exceptions=True
+    )
+    items: List[Dict[str, Any]] = []
+    for result in results:
+        if isinstance(result, HTTPException):
+            items.append({"status_code": result.status_code, "detail": result.detail})
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            items.append(result)
+    return items
+
+# WebSocket echo (agent interface)
+async def _websocket_writer(websocket: WebSocket, outbox: asyncio.Queue):
+    """Send queued replies so a slow client only backs up its own bounded queue"""
+    while True:
+        await websocket.send_text(await outbox.get())
+
+@router.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    """WebSocket endpoint for real-time communication"""
+    await websocket.accept()
+    outbox: asyncio.Queue = asyncio.Queue(maxsize=WS_MAX_PENDING)
+    writer = asyncio.create_task(_websocket_writer(websocket, outbox))
+    close_code: Optional[int] = 1000
+    try:
+        while True:
+            receive = asyncio.ensure_future(websocket.receive_text())
+            await asyncio.wait((receive, writer), return_when=asyncio.FIRST_COMPLETED)
+            if writer.done():
+                # The writer only stops when a send fails, so the connection is gone
+                receive.cancel()
+                await asyncio.gather(receive, return_exceptions=True)
+                logger.error(f"WebSocket send failed: {writer.exception()}")
+                close_code = None
+                break
+            data = receive.result()
+            # Echo back the message for now. Every frame is validated, then spliced in
+            # verbatim rather than re-serialized, which also keeps integers wider than
+            # 64 bits exact
+            try:
+                orjson.loads(data)
+            except orjson.JSONDecodeError:
+                reply = WS_INVALID_JSON_REPLY
+            else:
+                reply = f'{{"status":"received","message":{data}}}'
+            try:
+                outbox.put_nowait(reply)
+            except asyncio.QueueFull:
+                logger.warning(f"WebSocket client has {WS_MAX_PENDING} unsent replies, closing connection")
+                close_code = 1013
+                break
+    except Exception as e:
+        logger.error(f"WebSocket error: {e}")
+    finally:
+        writer.cancel()
+        # Retrieve the writer's outcome so a failed send is never left unhandled
+        await asyncio.gather(writer, return_exceptions=True)
+        if close_code is not None:
+            await websocket.close(code=close_code)
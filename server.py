@@ -1,26 +1,27 @@
-from fastapi import FastAPI, WebSocket, Request, HTTPException, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, JSONResponse
 from pathlib import Path
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
-from web3 import Web3
-from morpho_constants import (
-    BASE_RPC_URL,
-    MORPHO_LENS_ADDRESS,
-    MORPHO_FACTORY_ADDRESS,
-    MORPHO_LENS_ABI,
-    MORPHO_FACTORY_ABI,
-    MARKETS
+from cachetools import LRUCache, TTLCache
+from morpho_constants import BASE_RPC_URL
+from chain import (
+    check_lens_code,
+    current_block_number,
+    get_w3,
+    start_block_ticker,
+    stop_block_ticker
 )
+from routes import router
 import os
+import bisect
 import logging
 import traceback
-from typing import Dict, Any
-import requests
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import aiohttp
 import time
 from dotenv import load_dotenv
-import json
-import asyncio
 
 # Load environment variables
 load_dotenv('.env.local')
@@ -29,52 +30,67 @@ load_dotenv('.env.local')
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("mcp_server")
 
-app = FastAPI()
 BASE = Path(__file__).parent.resolve()
+PUBLIC_DIR = BASE / "public"
 
-# Global variables for Web3 and contracts
-w3 = None
-morpho_lens = None
-morpho_factory = None
+# Cached public directory listing, rebuilt when the directory's mtime changes.
+# Nested changes don't touch the root mtime, so the TTL bounds staleness.
+FILES_CACHE_TTL = 1.0
+
+class FileListing(NamedTuple):
+    """Immutable snapshot of the public directory; names[i] starts at offsets[i] in joined"""
+    mtime: int
+    built_at: float
+    entries: Tuple[str, ...]
+    names: Tuple[str, ...]
+    joined: str
+    offsets: Tuple[int, ...]
+
+# /files runs in the threadpool, so a rebuild swaps in a new snapshot rather than
+# mutating one a concurrent request may be reading
+_files_listing = FileListing(0, 0.0, (), (), "", ())
 
 # Add Basescan API configuration
 BASESCAN_API_KEY = os.getenv("BASESCAN_API_KEY", "")  # Get from .env
 BASESCAN_API_URL = "https://api.basescan.org/api"
-
-# Initialize Web3 for Base chain
-try:
-    w3 = Web3(Web3.HTTPProvider(BASE_RPC_URL))
-    if not w3.is_connected():
-        logger.error(f"Failed to connect to Base RPC: {BASE_RPC_URL}")
-    else:
-        logger.info(f"Connected to Base chain. Current block: {w3.eth.block_number}")
-        
-    # Initialize Morpho Lens contract
+BASESCAN_SESSION: Optional[aiohttp.ClientSession] = None
+
+# Verification status rarely changes, so results (including negative ones) are
+# cached for an hour; deployed bytecode never changes and is cached for good.
+BASESCAN_CACHE_TTL = 3600
+_verification_cache: TTLCache = TTLCache(maxsize=256, ttl=BASESCAN_CACHE_TTL)
+_code_cache: Dict[str, bytes] = {}
+# Bytecode per (address, block) for addresses whose code may still change
+_code_at_cache: LRUCache = LRUCache(maxsize=1024)
+
+async def check_connection():
+    """Log whether the Base RPC is reachable"""
     try:
-        # Convert address to checksum format
-        lens_address = w3.to_checksum_address(MORPHO_LENS_ADDRESS)
-        morpho_lens = w3.eth.contract(address=lens_address, abi=MORPHO_LENS_ABI)
-        logger.info(f"Initialized Morpho Lens contract at {lens_address}")
+        w3 = get_w3()
+        if not await w3.is_connected():
+            logger.error(f"Failed to connect to Base RPC: {BASE_RPC_URL}")
+        else:
+            start_block_ticker()
+            logger.info(f"Connected to Base chain. Current block: {await current_block_number()}")
+            await check_lens_code()
     except Exception as e:
-        logger.error(f"Error initializing Morpho Lens contract: {str(e)}")
-        morpho_lens = None
-        
-    # Initialize Morpho Factory contract
+        logger.error(f"Error connecting to Base RPC: {str(e)}")
+        logger.error(traceback.format_exc())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Hold the shared Basescan session and the block ticker for the app's lifetime"""
+    global BASESCAN_SESSION
+    # Shared Basescan HTTP session so lookups reuse pooled connections
+    BASESCAN_SESSION = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5))
+    await check_connection()
     try:
-        # Convert address to checksum format
-        factory_address = w3.to_checksum_address(MORPHO_FACTORY_ADDRESS)
-        morpho_factory = w3.eth.contract(address=factory_address, abi=MORPHO_FACTORY_ABI)
-        logger.info(f"Initialized Morpho Factory contract at {factory_address}")
-    except Exception as e:
-        logger.error(f"Error initializing Morpho Factory contract: {str(e)}")
-        morpho_factory = None
-except Exception as e:
-    logger.error(f"Error initializing Web3: {str(e)}")
-    logger.error(traceback.format_exc())
-    # We'll initialize these as None and handle errors in the functions
-    w3 = None
-    morpho_lens = None
-    morpho_factory = None
+        yield
+    finally:
+        await stop_block_ticker()
+        await BASESCAN_SESSION.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS (for web/public agent access)
 app.add_middleware(
@@ -86,31 +102,105 @@ app.add_middleware(
 )
 
 # Mount public directory
-app.mount("/public", StaticFiles(directory=BASE / "public"), name="public")
+app.mount("/public", StaticFiles(directory=PUBLIC_DIR), name="public")
+
+# Tools endpoint and WebSocket echo (agent interface)
+app.include_router(router)
+
+def _list_public_files() -> FileListing:
+    """Return the cached public directory listing, rescanning only when stale"""
+    global _files_listing
+    listing = _files_listing
+    mtime = os.stat(PUBLIC_DIR).st_mtime_ns
+    now = time.monotonic()
+    if mtime != listing.mtime or now - listing.built_at > FILES_CACHE_TTL:
+        paths = list(PUBLIC_DIR.rglob("*"))
+        names = tuple(p.name.lower() for p in paths)
+        # Names are searched as one newline-joined string; offsets[i] is where names[i] starts
+        offsets = []
+        position = 0
+        for name in names:
+            offsets.append(position)
+            position += len(name) + 1
+        listing = FileListing(
+            mtime=mtime,
+            built_at=now,
+            entries=tuple(str(p.relative_to(PUBLIC_DIR)) for p in paths),
+            names=names,
+            joined="\n".join(names),
+            offsets=tuple(offsets),
+        )
+        _files_listing = listing
+    return listing
+
+def _find_name_matches(q: str, listing: FileListing) -> List[int]:
+    """Return indices of names containing q, scanning the joined names with str.find"""
+    joined, offsets, names = listing.joined, listing.offsets, listing.names
+    hits = []
+    pos = joined.find(q)
+    while pos != -1:
+        index = bisect.bisect_right(offsets, pos) - 1
+        end = offsets[index] + len(names[index])
+        if pos + len(q) <= end:
+            hits.append(index)
+            # Skip to the next name so each file is reported once
+            pos = joined.find(q, end + 1)
+        else:
+            # The hit spans a name boundary
+            pos = joined.find(q, pos + 1)
+    return hits
 
 # File search
 @app.get("/files")
 def search_files(q: str = ""):
-    base = BASE / "public"
+    listing = _list_public_files()
+    if not q:
+        return {"matches": list(listing.entries)}
+    entries = listing.entries
     return {
-        "matches": [str(p.relative_to(base)) for p in base.rglob("*") if q.lower() in p.name.lower()]
+        "matches": [entries[i] for i in _find_name_matches(q.lower(), listing)]
     }
 
 # Read a file
 @app.get("/files/{filename}")
 def read_file(filename: str):
-    file_path = BASE / "public" / filename
+    file_path = PUBLIC_DIR / filename
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="File not found")
     return FileResponse(file_path)
 
-def verify_contract_on_basescan(address: str) -> bool:
+async def _code_at(address: str, block: int) -> bytes:
+    """Get the bytecode at an address as of a block, cached per (address, block)."""
+    if not block:
+        # Block number not known yet; read the latest state without caching it
+        return await get_w3().eth.get_code(address)
+    code = _code_at_cache.get((address, block))
+    if code is None:
+        code = await get_w3().eth.get_code(address, block_identifier=block)
+        _code_at_cache[(address, block)] = code
+    return code
+
+async def get_code(address: str) -> bytes:
+    """Get the bytecode at an address, caching it once a contract is found."""
+    code = _code_cache.get(address)
+    if code is None:
+        code = await _code_at(address, await current_block_number())
+        if code:
+            _code_cache[address] = code
+    return code
+
+async def verify_contract_on_basescan(address: str) -> bool:
     """Verify if a contract exists and is verified on Basescan."""
+    cached = _verification_cache.get(address)
+    if cached is not None:
+        return cached
+
     try:
         # First check if there's contract code at the address
-        code = w3.eth.get_code(address)
+        code = await get_code(address)
         if not code:
             logger.error(f"No contract code found at address: {address}")
+            _verification_cache[address] = False
             return False
             
         logger.info(f"Contract code found at address: {address}")
@@ -124,20 +214,20 @@ def verify_contract_on_basescan(address: str) -> bool:
         }
         
         logger.info(f"Checking contract verification on Basescan for address: {address}")
-        response = requests.get(BASESCAN_API_URL, params=params)
-        
-        if response.status_code == 200:
-            result = response.json()
-            logger.info(f"Basescan API response: {result}")
-            
-            if result["status"] == "1" and result["message"] == "OK":
-                logger.info(f"Contract verified on Basescan: {address}")
-                return True
-            else:
-                logger.warning(f"Contract not verified on Basescan: {address}. Response: {result}")
+        async with BASESCAN_SESSION.get(BASESCAN_API_URL, params=params) as response:
+            if response.status != 200:
+                logger.error(f"Failed to get response from Basescan API. Status code: {response.status}")
                 return False
+            result = await response.json()
+
+        logger.info(f"Basescan API response: {result}")
+        if result["status"] == "1" and result["message"] == "OK":
+            logger.info(f"Contract verified on Basescan: {address}")
+            _verification_cache[address] = True
+            return True
         else:
-            logger.error(f"Failed to get response from Basescan API. Status code: {response.status_code}")
+            logger.warning(f"Contract not verified on Basescan: {address}. Response: {result}")
+            _verification_cache[address] = False
             return False
             
     except Exception as e:
@@ -145,95 +235,6 @@ def verify_contract_on_basescan(address: str) -> bool:
         logger.error(f"Traceback: {traceback.format_exc()}")
         return False
 
-async def summarize_text(text: str) -> Dict[str, Any]:
-    """Summarize the given text"""
-    # For now, just echo the text
-    return {"summary": text}
-
-async def get_morpho_position(wallet_address: str, pool_id: str) -> Dict[str, Any]:
-    """Get Morpho position for a wallet in a specific pool"""
-    try:
-        # Validate addresses
-        wallet_address = Web3.to_checksum_address(wallet_address)
-        
-        # Get market address from pool_id
-        market_address = MARKETS.get(pool_id)
-        if not market_address:
-            raise HTTPException(status_code=400, detail=f"Invalid pool_id: {pool_id}")
-        
-        market_address = Web3.to_checksum_address(market_address)
-        
-        # Check if contract exists at market address
-        code = w3.eth.get_code(market_address)
-        if code == b'':
-            raise HTTPException(
-                status_code=400,
-                detail=f"No contract found at market address: {market_address}"
-            )
-        
-        # Get position from Morpho Lens
-        position = morpho_lens.functions.position(
-            market_address,
-            wallet_address
-        ).call()
-        
-        return {
-            "wallet": wallet_address,
-            "pool_id": pool_id,
-            "market_address": market_address,
-            "position": {
-                "supply": str(position[0]),
-                "borrow": str(position[1]),
-                "collateral": str(position[2])
-            }
-        }
-    except Exception as e:
-        logger.error(f"Error getting Morpho position: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Tools endpoint
-@app.post("/tools")
-async def run_tool(request: Dict[str, Any]):
-    """Run a specific tool based on the request"""
-    try:
-        task = request.get("task")
-        if not task:
-            raise HTTPException(status_code=400, detail="No task specified")
-
-        if task == "summarize":
-            text = request.get("text", "")
-            return await summarize_text(text)
-        elif task == "morpho_get_position":
-            wallet = request.get("wallet")
-            pool_id = request.get("pool_id")
-            if not wallet or not pool_id:
-                raise HTTPException(status_code=400, detail="Missing wallet or pool_id")
-            return await get_morpho_position(wallet, pool_id)
-        else:
-            raise HTTPException(status_code=400, detail=f"Unknown task: {task}")
-    except Exception as e:
-        logger.error(f"Error running tool: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-# WebSocket echo (agent interface)
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for real-time communication"""
-    await websocket.accept()
-    try:
-        while True:
-            data = await websocket.receive_text()
-            try:
-                message = json.loads(data)
-                # Echo back the message for now
-                await websocket.send_json({"status": "received", "message": message})
-            except json.JSONDecodeError:
-                await websocket.send_json({"status": "error", "message": "Invalid JSON"})
-    except Exception as e:
-        logger.error(f"WebSocket error: {e}")
-    finally:
-        await websocket.close()
-
 @app.get("/")
 async def root():
     """Health check endpoint"""
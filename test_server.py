@@ -1,10 +1,14 @@
 import asyncio
+import aiohttp
 import websockets
-import requests
-import json
-from typing import Dict, Any, Optional
+import orjson
+from typing import Dict, Any, List, Optional, Tuple
 import sys
 import logging
+import time
+import traceback
+import types
+from contextlib import asynccontextmanager
 from datetime import datetime
 
 # Configure logging
@@ -14,49 +18,157 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+BASE_URL = "http://localhost:8080"
+WS_URL = "ws://localhost:8080/ws"
+JSON_HEADERS = {"Content-Type": "application/json"}
+# Server-side cap on /tools list bodies
+MAX_TOOL_BATCH = 100
+
+# Known valid market addresses
+VALID_MARKETS = types.MappingProxyType({
+    "cbBTC/USDC": "0x38f3D1F44Cbe64A033CA1A63889f9d6a6F2E8E37",
+    "cbETH/USDC": "0x0d1Fe8eAdb0a3e44C4Cc9D73De8dA50C1E475832",
+    "wstETH/USDC": "0x9D9EBCc8E7B4eF061C0F7Bab532d1710b874f789",
+    "USDbC/USDC": "0x0B1A02A7309dFbfAD1Cd623dF63DD56e12F36f36"
+})
+
+# Module-wide HTTP session so every tester (and repeated runs) reuse warm connections
+_shared_session: Optional[aiohttp.ClientSession] = None
+_shared_session_users = 0
+
+@asynccontextmanager
+async def shared_session():
+    """Yield the shared ClientSession, closing it when the outermost user exits"""
+    global _shared_session, _shared_session_users
+    if _shared_session is None or _shared_session.closed:
+        _shared_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit_per_host=8,
+                keepalive_timeout=75,
+                enable_cleanup_closed=True,
+                force_close=False
+            )
+        )
+    _shared_session_users += 1
+    try:
+        yield _shared_session
+    finally:
+        _shared_session_users -= 1
+        if _shared_session_users == 0:
+            await _shared_session.close()
+            _shared_session = None
+
+async def _ws_producer(websocket, messages: List[str], sent: asyncio.Queue):
+    """Send every message back-to-back, queueing each one to await its reply"""
+    for msg in messages:
+        await websocket.send(msg)
+        await sent.put(msg)
+
+async def _ws_consumer(websocket, sent: asyncio.Queue, count: int) -> List[Tuple[str, str]]:
+    """Pair each reply with the sent message it answers, in send order"""
+    pairs = []
+    for _ in range(count):
+        response = await websocket.recv()
+        pairs.append((await sent.get(), response))
+    return pairs
+
 class ServerTester:
-    def __init__(self):
-        self.base_url = "http://localhost:8080"
-        self.ws_url = "ws://localhost:8080/ws"
+    def __init__(self, session: aiohttp.ClientSession):
+        self.base_url = BASE_URL
+        self.ws_url = WS_URL
+        self.files_url = f"{self.base_url}/files"
+        self.tools_url = f"{self.base_url}/tools"
+        self.static_url = f"{self.base_url}/public/test.txt"
         self.results: Dict[str, bool] = {}
-        self.test_start_time = datetime.now()
+        # (message, seconds since start) per test, printed by print_results
+        self.details: Dict[str, Tuple[str, float]] = {}
+        self._t0 = time.perf_counter()
+        self.session = session
         
         # Test wallet with known Morpho positions
         self.wallet_address = "0x2E2Ea30Ba045Df4bC38e80cF11E119E12e06C1C2"
         self.pool_id = "cbBTC/USDC"
         
-        # Known valid market addresses
-        self.valid_markets = {
-            "cbBTC/USDC": "0x38f3D1F44Cbe64A033CA1A63889f9d6a6F2E8E37",
-            "cbETH/USDC": "0x0d1Fe8eAdb0a3e44C4Cc9D73De8dA50C1E475832",
-            "wstETH/USDC": "0x9D9EBCc8E7B4eF061C0F7Bab532d1710b874f789",
-            "USDbC/USDC": "0x0B1A02A7309dFbfAD1Cd623dF63DD56e12F36f36"
-        }
+        # Tool requests are static, so their JSON bodies are encoded once up front
+        self.tool_tasks = [
+            {
+                "task": "summarize",
+                "text": "This is a test message that should be summarized."
+            },
+            {
+                "task": "morpho_get_position",
+                "wallet": self.wallet_address,
+                "pool_id": self.pool_id
+            }
+        ]
+        self._tool_payloads = {task["task"]: orjson.dumps(task) for task in self.tool_tasks}
+        
+        self.morpho_test_cases = [
+            {
+                "name": "valid wallet",
+                "wallet": self.wallet_address,
+                "pool_id": self.pool_id,
+                "expected_status": 200
+            },
+            {
+                "name": "invalid wallet",
+                "wallet": "0xinvalid",
+                "pool_id": self.pool_id,
+                "expected_status": 400
+            },
+            {
+                "name": "invalid pool",
+                "wallet": self.wallet_address,
+                "pool_id": "INVALID/POOL",
+                "expected_status": 400
+            }
+        ]
+        for test_case in self.morpho_test_cases:
+            test_case["payload"] = orjson.dumps({
+                "task": "morpho_get_position",
+                "wallet": test_case["wallet"],
+                "pool_id": test_case["pool_id"]
+            })
 
-    def print_result(self, test_name: str, success: bool, message: str = ""):
-        """Print test result with emoji and formatting"""
+        # One list body mixing good and bad entries; the bad one must fail on its own
+        self._batch_payload = orjson.dumps(self.tool_tasks + [
+            {"task": "morpho_get_position", "wallet": "0xinvalid", "pool_id": self.pool_id}
+        ])
+        self._oversized_batch_payload = orjson.dumps([self.tool_tasks[0]] * (MAX_TOOL_BATCH + 1))
+
+    def record_result(self, test_name: str, success: bool, message: str = ""):
+        """Record a test result; print_results writes them all once the tests finish"""
         self.results[test_name] = success
-        status = "✅ PASS" if success else "❌ FAIL"
-        duration = (datetime.now() - self.test_start_time).total_seconds()
-        print(f"\n{status} - {test_name} ({duration:.2f}s)")
-        if message:
-            print(f"   Message: {message}")
+        self.details[test_name] = (message, time.perf_counter() - self._t0)
+
+    def print_results(self):
+        """Print every recorded result with emoji and formatting in a single write"""
+        buf = []
+        for test_name, success in self.results.items():
+            message, duration = self.details[test_name]
+            status = "✅ PASS" if success else "❌ FAIL"
+            buf.append(f"\n{status} - {test_name} ({duration:.2f}s)\n")
+            if message:
+                buf.append(f"   Message: {message}\n")
+        sys.stdout.write("".join(buf))
 
     async def test_server_health(self):
         """Test basic server health and connectivity"""
         try:
-            response = requests.get(self.base_url)
-            response.raise_for_status()
-            self.print_result("Server Health", True, "Server is up and responding")
+            async with self.session.get(self.base_url) as response:
+                if not response.ok:
+                    raise ValueError(f"HTTP {response.status}")
+            self.record_result("Server Health", True, "Server is up and responding")
         except Exception as e:
-            self.print_result("Server Health", False, f"Server health check failed: {str(e)}")
+            self.record_result("Server Health", False, f"Server health check failed: {str(e)}")
 
     async def test_files_endpoint(self):
         """Test the /files endpoint with validation"""
         try:
-            response = requests.get(f"{self.base_url}/files")
-            response.raise_for_status()
-            data = response.json()
+            async with self.session.get(self.files_url) as response:
+                if not response.ok:
+                    raise ValueError(f"HTTP {response.status}")
+                data = await response.json()
             
             # Validate response structure
             if not isinstance(data, dict):
@@ -66,59 +178,78 @@ class ServerTester:
             if not isinstance(matches, list):
                 raise ValueError("'matches' is not a list")
             
-            self.print_result("Files Endpoint", True, 
+            self.record_result("Files Endpoint", True, 
                             f"Found {len(matches)} files, response structure valid")
         except Exception as e:
-            self.print_result("Files Endpoint", False, str(e))
+            self.record_result("Files Endpoint", False, str(e))
 
     async def test_tools_endpoint(self):
         """Test the /tools endpoint with multiple tasks"""
-        tasks = [
-            {
-                "task": "summarize",
-                "text": "This is a test message that should be summarized."
-            },
-            {
-                "task": "morpho_get_position",
-                "wallet": self.wallet_address,
-                "pool_id": self.pool_id
-            }
-        ]
-        
-        for task in tasks:
+        for task in self.tool_tasks:
             try:
                 logger.info(f"Testing tools endpoint with task: {task['task']}")
-                response = requests.post(
-                    f"{self.base_url}/tools",
-                    json=task
-                )
-                
-                # Log response details
-                logger.info(f"Response status: {response.status_code}")
-                logger.info(f"Response headers: {dict(response.headers)}")
-                
-                try:
-                    response_content = response.json()
-                    logger.info(f"Response content: {json.dumps(response_content, indent=2)}")
-                except Exception as e:
-                    logger.error(f"Could not parse response as JSON: {str(e)}")
-                    logger.error(f"Raw response: {response.text}")
-                
-                if response.status_code == 200:
-                    self.print_result(f"Tools Endpoint - {task['task']}", True, 
-                                    f"Response: {json.dumps(response_content, indent=2)}")
-                else:
-                    error_detail = "Unknown error"
+                async with self.session.post(
+                    self.tools_url,
+                    data=self._tool_payloads[task["task"]],
+                    headers=JSON_HEADERS
+                ) as response:
+                    # Log response details
+                    logger.info(f"Response status: {response.status}")
+                    logger.info("Response headers: %s", response.headers)
+                    text = await response.text()
+                    
+                    parsed = None
                     try:
-                        error_response = response.json()
-                        error_detail = error_response.get("detail", str(response.text))
-                    except:
-                        error_detail = str(response.text)
+                        parsed = orjson.loads(text)
+                        logger.info("Response content: %s", parsed)
+                    except Exception as e:
+                        logger.error(f"Could not parse response as JSON: {str(e)}")
+                        logger.error(f"Raw response: {text}")
                     
-                    self.print_result(f"Tools Endpoint - {task['task']}", False,
-                                    f"HTTP error {response.status_code}: {error_detail}")
+                    if response.status == 200:
+                        self.record_result(f"Tools Endpoint - {task['task']}", True, 
+                                        f"Response: {parsed!r}")
+                    else:
+                        error_detail = parsed.get("detail", text) if isinstance(parsed, dict) else text
+                        self.record_result(f"Tools Endpoint - {task['task']}", False,
+                                        f"HTTP error {response.status}: {error_detail}")
             except Exception as e:
-                self.print_result(f"Tools Endpoint - {task['task']}", False, str(e))
+                self.record_result(f"Tools Endpoint - {task['task']}", False, str(e))
+
+    async def test_tools_batch(self):
+        """Test the /tools list form, including per-item errors and the batch size limit"""
+        test_name = "Tools Endpoint - batch"
+        try:
+            async with self.session.post(
+                self.tools_url,
+                data=self._batch_payload,
+                headers=JSON_HEADERS
+            ) as response:
+                if not response.ok:
+                    raise ValueError(f"HTTP {response.status}: {await response.text()}")
+                items = orjson.loads(await response.read())
+            
+            if not isinstance(items, list) or len(items) != len(self.tool_tasks) + 1:
+                raise ValueError(f"Expected {len(self.tool_tasks) + 1} results, got: {items!r}")
+            if "summary" not in items[0]:
+                raise ValueError(f"Unexpected summarize result: {items[0]!r}")
+            if items[1].get("status_code") is not None:
+                raise ValueError(f"Valid position request failed: {items[1]!r}")
+            if items[2].get("status_code") != 400 or "detail" not in items[2]:
+                raise ValueError(f"Invalid wallet was not reported as a 400 item: {items[2]!r}")
+            
+            async with self.session.post(
+                self.tools_url,
+                data=self._oversized_batch_payload,
+                headers=JSON_HEADERS
+            ) as response:
+                if response.status != 400:
+                    raise ValueError(f"Oversized batch returned HTTP {response.status}, expected 400")
+            
+            self.record_result(test_name, True,
+                            f"Per-item error: {items[2]!r}; oversized batch rejected")
+        except Exception as e:
+            self.record_result(test_name, False, str(e))
 
     async def test_websocket(self):
         """Test WebSocket connection with multiple messages"""
@@ -127,149 +258,174 @@ class ServerTester:
                 # Test multiple messages
                 messages = [
                     "Hello WebSocket!",
-                    json.dumps({"type": "test", "data": "JSON message"}),
+                    orjson.dumps({"type": "test", "data": "JSON message"}).decode(),
                     "Final message"
                 ]
                 
-                for msg in messages:
-                    await websocket.send(msg)
-                    response = await websocket.recv()
+                # Pipeline the sends instead of waiting a round trip per message
+                sent: asyncio.Queue = asyncio.Queue()
+                _, pairs = await asyncio.gather(
+                    _ws_producer(websocket, messages, sent),
+                    _ws_consumer(websocket, sent, len(messages))
+                )
+                for msg, response in pairs:
                     logger.info(f"WebSocket message sent: {msg}")
                     logger.info(f"WebSocket response received: {response}")
                 
                 # Gracefully close
                 await websocket.close(code=1000, reason="Test completed")
-                self.print_result("WebSocket", True, "Successfully sent multiple messages")
+                self.record_result("WebSocket", True, "Successfully sent multiple messages")
         except Exception as e:
             if "code = 1000" in str(e):
-                self.print_result("WebSocket", True, "Connection closed normally")
+                self.record_result("WebSocket", True, "Connection closed normally")
             else:
-                self.print_result("WebSocket", False, str(e))
+                self.record_result("WebSocket", False, str(e))
 
     async def test_static_file(self):
         """Test static file serving with validation"""
         try:
-            response = requests.get(f"{self.base_url}/public/test.txt")
-            response.raise_for_status()
-            
-            # Validate content type
-            content_type = response.headers.get('content-type', '')
-            if 'text/plain' not in content_type:
-                raise ValueError(f"Unexpected content type: {content_type}")
-            
-            content = response.text
+            async with self.session.get(self.static_url) as response:
+                if not response.ok:
+                    raise ValueError(f"HTTP {response.status}")
+                
+                # Validate content type
+                content_type = response.headers.get('content-type', '')
+                if 'text/plain' not in content_type:
+                    raise ValueError(f"Unexpected content type: {content_type}")
+                
+                content = await response.text()
             if not content:
                 raise ValueError("Empty file content")
             
-            self.print_result("Static File", True, 
+            self.record_result("Static File", True, 
                             f"Content type: {content_type}, Content: {content}")
         except Exception as e:
-            self.print_result("Static File", False, str(e))
+            self.record_result("Static File", False, str(e))
 
     async def test_morpho_position_tool(self):
-        """Test Morpho position tool with validation"""
-        try:
-            # Test with known valid market
-            market_address = self.valid_markets.get(self.pool_id)
-            if not market_address:
-                raise ValueError(f"No valid market address found for pool {self.pool_id}")
-            
-            test_data = {
-                "task": "morpho_get_position",
-                "wallet": self.wallet_address,
-                "pool_id": self.pool_id
-            }
-            
-            logger.info(f"Testing Morpho Position Tool with data: {json.dumps(test_data, indent=2)}")
-            logger.info(f"Using market address: {market_address}")
-            
-            response = requests.post(
-                f"{self.base_url}/tools",
-                json=test_data
-            )
-            
-            # Log response details
-            logger.info(f"Response status: {response.status_code}")
-            logger.info(f"Response headers: {dict(response.headers)}")
-            
+        """Test Morpho position tool with valid and invalid inputs"""
+        # Test with known valid market
+        market_address = VALID_MARKETS.get(self.pool_id)
+        if not market_address:
+            self.record_result("Morpho Position Tool", False,
+                            f"No valid market address found for pool {self.pool_id}")
+            return
+        logger.info(f"Using market address: {market_address}")
+        
+        async def run_case(test_case: Dict[str, Any]):
+            test_name = f"Morpho Position Tool - {test_case['name']}"
             try:
-                response_content = response.json()
-                logger.info(f"Response content: {json.dumps(response_content, indent=2)}")
-            except Exception as e:
-                logger.error(f"Could not parse response as JSON: {str(e)}")
-                logger.error(f"Raw response: {response.text}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                required_fields = ["supply_shares", "borrow_shares", "collateral"]
-                missing_fields = [field for field in required_fields if field not in data]
+                logger.info("Testing Morpho Position Tool with data: %s", test_case["payload"])
                 
-                if missing_fields:
-                    self.print_result("Morpho Position Tool", False,
-                                    f"Missing required fields: {missing_fields}")
-                else:
-                    self.print_result("Morpho Position Tool", True,
-                                    f"Position data: {json.dumps(data, indent=2)}")
-            else:
-                error_detail = "Unknown error"
+                async with self.session.post(
+                    self.tools_url,
+                    data=test_case["payload"],
+                    headers=JSON_HEADERS
+                ) as response:
+                    status = response.status
+                    # Log response details
+                    logger.info(f"Response status: {status}")
+                    logger.info("Response headers: %s", response.headers)
+                    text = await response.text()
+                
+                parsed = None
                 try:
-                    error_response = response.json()
-                    error_detail = error_response.get("detail", str(response.text))
-                except:
-                    error_detail = str(response.text)
+                    parsed = orjson.loads(text)
+                    logger.info("Response content: %s", parsed)
+                except Exception as e:
+                    logger.error(f"Could not parse response as JSON: {str(e)}")
+                    logger.error(f"Raw response: {text}")
                 
-                self.print_result("Morpho Position Tool", False,
-                                f"HTTP error {response.status_code}: {error_detail}")
-        except Exception as e:
-            self.print_result("Morpho Position Tool", False, str(e))
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
+                if status == 200 and test_case["expected_status"] == 200:
+                    data = parsed if isinstance(parsed, dict) else {}
+                    # On-chain reads nest the amounts under "position"; mock and empty
+                    # fallbacks return them at the top level
+                    if data.get("source") == "chain":
+                        fields = data.get("position") or {}
+                        required_fields = ["supply", "borrow", "collateral"]
+                    else:
+                        fields = data
+                        required_fields = ["supply_shares", "borrow_shares", "collateral"]
+                    missing_fields = [field for field in required_fields if field not in fields]
+                    
+                    if missing_fields:
+                        self.record_result(test_name, False,
+                                        f"Missing required fields: {missing_fields}")
+                    else:
+                        self.record_result(test_name, True,
+                                        f"Position data: {data!r}")
+                else:
+                    error_detail = parsed.get("detail", text) if isinstance(parsed, dict) else text
+                    if status == test_case["expected_status"]:
+                        self.record_result(test_name, True,
+                                        f"Rejected with HTTP {status}: {error_detail}")
+                    else:
+                        self.record_result(test_name, False,
+                                        f"HTTP error {status}: {error_detail}")
+            except Exception as e:
+                self.record_result(test_name, False, str(e))
+                logger.error(f"Traceback: {traceback.format_exc()}")
+        
+        # The cases are independent, so run them concurrently over the pooled session
+        await asyncio.gather(*(run_case(test_case) for test_case in self.morpho_test_cases))
 
     def print_summary(self):
         """Print detailed test summary with statistics"""
-        print("\n📊 Test Summary:")
-        print("=" * 50)
         total = len(self.results)
-        passed = sum(1 for v in self.results.values() if v)
+        passed = sum(self.results.values())
         failed = total - passed
-        duration = (datetime.now() - self.test_start_time).total_seconds()
-        
-        print(f"⏱️  Total Duration: {duration:.2f}s")
-        print(f"📝 Total Tests: {total}")
-        print(f"✅ Passed: {passed}")
-        print(f"❌ Failed: {failed}")
-        print(f"📈 Success Rate: {(passed/total)*100:.1f}%")
+        duration = time.perf_counter() - self._t0
         
+        lines = [
+            "\n📊 Test Summary:",
+            "=" * 50,
+            f"⏱️  Total Duration: {duration:.2f}s",
+            f"📝 Total Tests: {total}",
+            f"✅ Passed: {passed}",
+            f"❌ Failed: {failed}",
+            f"📈 Success Rate: {(passed/total)*100:.1f}%",
+        ]
         if failed > 0:
-            print("\n❌ Failed Tests:")
-            for test_name, success in self.results.items():
-                if not success:
-                    print(f"   - {test_name}")
+            lines.append("\n❌ Failed Tests:")
+            lines.extend(f"   - {test_name}" for test_name, success in self.results.items() if not success)
+        lines.append("=" * 50)
         
-        print("=" * 50)
+        # One write instead of a line-buffered write per print()
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
 
 async def main():
     print("\n🚀 Starting Server Tests...")
     print("=" * 50)
     print(f"⏰ Start Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"🌐 Base URL: http://localhost:8080")
+    print(f"🌐 Base URL: {BASE_URL}")
     print("=" * 50)
     
-    tester = ServerTester()
-    
-    # Run all tests
-    await tester.test_server_health()
-    await tester.test_files_endpoint()
-    await tester.test_tools_endpoint()
-    await tester.test_websocket()
-    await tester.test_static_file()
-    await tester.test_morpho_position_tool()
+    async with shared_session() as session:
+        tester = ServerTester(session)
+        # Run all tests concurrently; they are independent network round trips
+        await asyncio.gather(
+            tester.test_server_health(),
+            tester.test_files_endpoint(),
+            tester.test_tools_endpoint(),
+            tester.test_tools_batch(),
+            tester.test_websocket(),
+            tester.test_static_file(),
+            tester.test_morpho_position_tool()
+        )
     
-    # Print summary
+    # Print results and summary
+    tester.print_results()
     tester.print_summary()
     
     # Exit with appropriate status code
     sys.exit(0 if all(tester.results.values()) else 1)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # uvloop is optional; fall back to the default event loop without it
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
\ No newline at end of file